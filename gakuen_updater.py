@@ -1,44 +1,140 @@
 import os
-import io
 import cv2
 import time
 import yaml
+import socket
+import functools
 import logging
 import numpy as np
-import pandas as pd
 
 from PIL import Image
-from MTM import matchTemplates
+from dataclasses import dataclass
+from numba import njit, prange, types
 from ppadb.client import Client as AdbClient
 
+MATCH_SCALE = 0.5 # scale applied to both the screenshot and the templates to locate template candidates
+MATCH_COARSE_MARGIN = 0.25 # how far below the threshold a downscaled score may be to still be checked at full resolution
+
+# compiled eagerly at import so the first call does not pay for the JIT, read-only so it also accepts np.frombuffer views of bytes
+@njit(types.float64(types.Array(types.uint8, 3, "C", readonly=True)), parallel=True, fastmath=True, cache=True)
+def mean_gray(rgba):
+    """Mean grayscale value of an RGBA image, computed in a single pass without building the grayscale image."""
+    h, w = rgba.shape[0], rgba.shape[1]
+    total = 0.0
+    for i in prange(h):
+        row = 0.0
+        for j in range(w):
+            row += 0.299 * rgba[i, j, 0] + 0.587 * rgba[i, j, 1] + 0.114 * rgba[i, j, 2]
+        total += row
+    return total / (h * w)
+
+def load_template(path: str) -> np.ndarray:
+    """Load an asset as a grayscale numpy array for template matching."""
+    template = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if template is None:
+        raise FileNotFoundError(f"Asset {path} not found.")
+    return template
+
+def pack_templates(templates: dict) -> dict:
+    """Copy the templates into a single contiguous buffer and return views into it, so they stay close together in memory."""
+    buffer = np.empty(sum(template.size for template in templates.values()), dtype=np.uint8)
+    packed = {}
+    offset = 0
+    for name, template in templates.items():
+        packed[name] = buffer[offset:offset + template.size].reshape(template.shape)
+        packed[name][...] = template
+        offset += template.size
+    return packed
+
+@dataclass
+class TemplateMatch():
+    """The best match of a single template in a screenshot."""
+    name: str
+    score: float
+    x: int
+    y: int
+    w: int
+    h: int
+
+@dataclass(frozen=True, slots=True)
+class Timeouts():
+    """Timeouts of each waiting step, in seconds."""
+    detect_credit_screen: int
+    detect_setup_screen: int
+    gakuen_running: int
+    download_start: int
+    download_finish: int
+
+@dataclass(frozen=True, slots=True)
+class Config():
+    """The configuration loaded from config.yaml."""
+    adb_host: str
+    adb_port: int
+    device_serial: str
+    uninstall: bool
+    install: bool
+    wait_for_download: bool
+    timeouts: Timeouts
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "Config":
+        """
+        Build the configuration from the parsed config.yaml.
+
+        Raises:
+            KeyError: If a setting is missing from the configuration.
+        """
+        return cls(adb_host=config['adb']['server']['host'],
+                   adb_port=config['adb']['server']['port'],
+                   device_serial=config['adb']['device_serial'],
+                   uninstall=config['uninstall'],
+                   install=config['install'],
+                   wait_for_download=config['wait_for_download'],
+                   timeouts=Timeouts(detect_credit_screen=config['timeouts']['detect_credit_screen'],
+                                     detect_setup_screen=config['timeouts']['detect_setup_screen'],
+                                     gakuen_running=config['timeouts']['gakuen_running'],
+                                     download_start=config['timeouts']['download_start'],
+                                     download_finish=config['timeouts']['download_finish']))
+
 class GakuenUpdater():
     log = logging.getLogger("MAIN")
 
-    ASSETS_NUMPY = { # load the assets as numpy arrays for template matching
-        "gakuen_setup": np.array(Image.open("assets/gakuen_setup.png").convert("L")),
-        "loading": np.array(Image.open("assets/gakuen_loading.png").convert("L")),
-        "playstore_install": np.array(Image.open("assets/playstore_install.png").convert("L")),
-        "gakuen_consent": np.array(Image.open("assets/gakuen_consent.png").convert("L")),
-        "gakuen_agree": np.array(Image.open("assets/gakuen_agree.png").convert("L")),
-        "gakuen_agree_all": np.array(Image.open("assets/gakuen_agree_all.png").convert("L")),
-        "gakuen_move_forward": np.array(Image.open("assets/gakuen_move_forward.png").convert("L")),
-    }
+    ASSETS_NUMPY = pack_templates({ # load the assets as numpy arrays for template matching
+        "gakuen_setup": load_template("assets/gakuen_setup.png"),
+        "loading": load_template("assets/gakuen_loading.png"),
+        "playstore_install": load_template("assets/playstore_install.png"),
+        "gakuen_consent": load_template("assets/gakuen_consent.png"),
+        "gakuen_agree": load_template("assets/gakuen_agree.png"),
+        "gakuen_agree_all": load_template("assets/gakuen_agree_all.png"),
+        "gakuen_move_forward": load_template("assets/gakuen_move_forward.png"),
+    })
+    ASSETS_SCALED = pack_templates({ # the assets downscaled by MATCH_SCALE, used to locate candidates before a full resolution check
+        name: cv2.resize(asset, None, fx=MATCH_SCALE, fy=MATCH_SCALE, interpolation=cv2.INTER_AREA)
+        for name, asset in ASSETS_NUMPY.items()
+    })
 
     def __init__(self) -> None:
         self.load_config()
-        logging.info(f"Connecting to ADB server at {self.config['adb']['server']['host']}:{self.config['adb']['server']['port']}")
-        self.adb = AdbClient(host=self.config['adb']['server']['host'],
-                              port=self.config['adb']['server']['port'])
+        logging.info(f"Connecting to ADB server at {self.config.adb_host}:{self.config.adb_port}")
+        self.adb = AdbClient(host=self.config.adb_host,
+                              port=self.config.adb_port)
         
-        assert self.config['adb']['device_serial'] in [d.serial for d in self.adb.devices()], f"Device {self.config['adb']['device_serial']} not found."
-        self.device = self.adb.device(self.config['adb']['device_serial'])
-        logging.info(f"Device {self.config['adb']['device_serial']} found.")
+        assert self.config.device_serial in [d.serial for d in self.adb.devices()], f"Device {self.config.device_serial} not found."
+        self.device = self.adb.device(self.config.device_serial)
+        logging.info(f"Device {self.config.device_serial} found.")
+
+        self._shot_gen = 0 # polling tick counter, bumped once per loop iteration
+        self._shot_cache = None # (gen, rgba_ndarray, gray_ndarray, scaled_gray_ndarray) of the last screenshot taken for a tick
+        self._exec_sizes = {} # command -> size of its last exec: output, used to allocate the receive buffer of the next one up front
+        cv2.setNumThreads(os.cpu_count() or 1) # let cvtColor/resize/matchTemplate spread large frames over every core
+        self._last_match = {} # asset key -> (x, y) of the last place each button was detected
+        self._match_buffers = {} # (asset key, result shape) -> correlation map reused by cv2.matchTemplate
 
     def load_config(self) -> None:
         # if the config file exists, load it
         if os.path.exists("config.yaml"):
             with open("config.yaml", "r") as f:
-                self.config = yaml.safe_load(f)
+                self.config = Config.from_dict(yaml.safe_load(f))
                 logging.info("Configuration loaded successfully.")
         else:
             raise FileNotFoundError("Configuration file not found.")
@@ -59,13 +155,13 @@ class GakuenUpdater():
         """
         self.rotate()
         
-        if self.config['uninstall']:
+        if self.config.uninstall:
             if self.gakuen_installed():
                 logging.info("Uninstalling Gakuen.")
                 self.uninstall_gakuen()
 
 
-        if not self.gakuen_installed() and self.config['install']:
+        if not self.gakuen_installed() and self.config.install:
             logging.info("Gakuen not installed, launching Play Store.")
             self.launch_playstore()
             self.playstore_install()
@@ -82,16 +178,16 @@ class GakuenUpdater():
         logging.info("Waiting for game to start.")
         assert self.wait_function(self.gakuen_running,
                                   exec_func=self.launch_gakuen,
-                                  timeout=self.config['timeouts']['gakuen_running'],
-                                  boolean=True) == True, "Game did not start in time, exiting."
+                                  timeout=self.config.timeouts.gakuen_running,
+                                  boolean=False) == True, "Game did not start in time, exiting." # wait while it is not running
 
         logging.info("Waiting for game to finish loading.")
         assert self.wait_function(self.detect_credit_screen, 
-                                  timeout=self.config['timeouts']['detect_credit_screen']) == True, "Game did not finish loading in time, exiting. (credits screen)"
+                                  timeout=self.config.timeouts.detect_credit_screen) == True, "Game did not finish loading in time, exiting. (credits screen)"
         logging.info("Passed credits screen.")
         
         assert self.wait_function(self.detect_setup_screen, 
-                                  timeout=self.config['timeouts']['detect_setup_screen']) == True, "Game did not finish loading in time, exiting. (loading screen)"
+                                  timeout=self.config.timeouts.detect_setup_screen) == True, "Game did not finish loading in time, exiting. (loading screen)"
         logging.info("Game loaded successfully.")
 
         self.click_middle_screen() # click the screen to start
@@ -103,7 +199,7 @@ class GakuenUpdater():
         self.button_click_loop()
         logging.info("Game download started.")
 
-        if not self.config['wait_for_download']:
+        if not self.config.wait_for_download:
             logging.info("flag set to not wait for download, exiting.")
             self.exit_gakuen()
             return
@@ -125,13 +221,15 @@ class GakuenUpdater():
             Exception: If the game does not start downloading in time.
 
         """
-        timeout = time.time() + self.config['timeouts']['download_start'] 
-        while self.get_screen_orientation() == 0:
-            self.detect_screen(1)
-            self.click_buttons(True)
+        timeout = time.time() + self.config.timeouts.download_start 
+        gen = self.next_tick()
+        while self.get_screen_orientation(gen=gen) == 0: # also captures the screenshot for this tick
+            self.detect_screen(1, gen=gen)
+            self.click_buttons(True, gen=gen)
             time.sleep(1)
             if time.time() > timeout:
                 raise Exception("Game did not start downloading in time, exiting.")
+            gen = self.next_tick()
     
     def download_loop(self):
         """
@@ -140,8 +238,8 @@ class GakuenUpdater():
         an exception is raised and the program exits.
         """
         logging.info("Entering download loop.")
-        timeout = time.time() + self.config['timeouts']['download_finish']
-        while not self.detect_move_forward():
+        timeout = time.time() + self.config.timeouts.download_finish
+        while not self.detect_move_forward(gen=self.next_tick()):
             self.click_middle_screen()
             time.sleep(1)
             if time.time() > timeout:
@@ -181,14 +279,14 @@ class GakuenUpdater():
         If the resolution is not supported, it raises an exception with the actual device resolution.
         """
         # match resolution in either horizontal or vertical direction
-        if self.get_resolution() == (2560, 1600):
+        if self.resolution == (2560, 1600):
             logging.info("Device resolution matched.")
             return
-        elif self.get_resolution() == (1600, 2560):
+        elif self.resolution == (1600, 2560):
             logging.info("Device resolution matched. (Rotated)")
             return
         else:
-            raise Exception(f"Device resolution {self.get_resolution()} not supported.")
+            raise Exception(f"Device resolution {self.resolution} not supported.")
 
     def press_home(self):
         """Presses the home button."""
@@ -201,18 +299,153 @@ class GakuenUpdater():
         Returns:
             Image.Image: The screenshot image as a PIL Image object.
         """
-        stream = io.BytesIO(self.device.screencap())
-        stream.seek(0)
-        return Image.open(stream)
+        return Image.fromarray(self.screenshot_raw())
+
+    def screenshot_raw(self) -> np.ndarray:
+        """
+        Take a screenshot from the raw framebuffer, skipping the PNG encode on the device and the decode on the host.
+
+        The output of `screencap` without `-p` is a small header (width, height, pixel format and, on newer
+        Android versions, the color space) followed by the RGBA pixels.
+
+        Returns:
+            np.ndarray: The screenshot as a (height, width, 4) RGBA numpy array.
+        """
+        return self._parse_screencap(self._exec("screencap"))
+
+    def _exec(self, cmd: str) -> np.ndarray:
+        """
+        Run a command on the device and return its raw output.
+
+        exec: is used instead of shell: so binary output is not mangled by a pty.
+        The output is received straight into an uninitialized buffer sized after the previous output of the same
+        command plus 64 KB of slack, instead of growing a buffer 4 KB at a time. The slack absorbs small changes in
+        the text part of chained commands and lets EOF be seen without growing the buffer, so in steady state a frame 
+        is received with a single allocation, no zero-fill and no copy. The buffer only grows (by doubling, with a copy) 
+        when the output is more than 64 KB bigger than the last time.
+
+        Args:
+            cmd (str): The command to run, it may chain several commands with `;`.
+
+        Returns:
+            np.ndarray: The raw output of the command, as a 1D uint8 array.
+        """
+        data = np.empty(self._exec_sizes.get(cmd, 0) + (1 << 16), dtype=np.uint8)
+        size = 0
+        conn = self.device.create_connection()
+        with conn:
+            conn.send(f"exec:{cmd}")
+            while True:
+                if size == len(data): # bigger than the last output, grow the buffer
+                    grown = np.empty(len(data) * 2, dtype=np.uint8)
+                    grown[:size] = data
+                    data = grown
+                received = conn.socket.recv_into(data[size:])
+                if not received:
+                    break
+                size += received
+
+        self._exec_sizes[cmd] = size
+        return data[:size]
+
+    @staticmethod
+    def _parse_screencap(data: bytes) -> np.ndarray:
+        """
+        Parse the raw output of `screencap` into an RGBA numpy array.
+
+        Args:
+            data (bytes): The raw `screencap` output, header included.
+
+        Returns:
+            np.ndarray: The screenshot as a (height, width, 4) RGBA numpy array.
+        """
+        w, h, pixel_format = np.frombuffer(data, dtype="<u4", count=3)
+        if pixel_format not in (1, 2): # RGBA_8888, RGBX_8888
+            raise Exception(f"Unsupported screencap pixel format: {pixel_format}")
+        header_size = len(data) - int(w) * int(h) * 4
+        if header_size not in (12, 16): # stray output (e.g. warnings on stderr) would otherwise shift the pixels
+            raise Exception(f"Unexpected screencap output size: {len(data)} bytes for {w}x{h}")
+        return np.frombuffer(data, dtype=np.uint8, offset=header_size).reshape(int(h), int(w), 4)
+
+    def screenshot_gray(self) -> np.ndarray:
+        """
+        Take a screenshot and return it as a grayscale numpy array.
+
+        Returns:
+            np.ndarray: The screenshot as a (height, width) grayscale numpy array.
+        """
+        return cv2.cvtColor(self.screenshot_raw(), cv2.COLOR_RGBA2GRAY)
+
+    def next_tick(self) -> int:
+        """
+        Advance the polling tick counter.
 
-    def get_screen_orientation(self) -> int:
+        Screenshots requested with the same tick are captured once and shared between detect calls.
+
+        Returns:
+            int: The new tick number.
+        """
+        self._shot_gen += 1
+        return self._shot_gen
+
+    def _get_screenshot(self, gen: int = None) -> tuple:
+        """
+        Get the screenshot for the given polling tick, capturing it only once per tick.
+
+        Args:
+            gen (int, optional): The polling tick to take the screenshot for. If None, a fresh screenshot is always taken.
+
+        Returns:
+            tuple: The screenshot as an RGBA numpy array, as a grayscale numpy array and 
+                as a grayscale numpy array downscaled by MATCH_SCALE for template matching.
+        """
+        if gen is not None and self._shot_cache is not None and self._shot_cache[0] == gen:
+            return self._shot_cache[1:]
+
+        return self._store_screenshot(self.screenshot_raw(), gen)
+
+    def _store_screenshot(self, rgba: np.ndarray, gen: int = None) -> tuple:
+        """
+        Convert a screenshot for detection and cache it for the given polling tick.
+
+        Args:
+            rgba (np.ndarray): The screenshot as an RGBA numpy array.
+            gen (int, optional): The polling tick the screenshot was taken for. If None, it is not cached.
+
+        Returns:
+            tuple: The same tuple as `_get_screenshot`.
+        """
+        gray = cv2.cvtColor(rgba, cv2.COLOR_RGBA2GRAY)
+        scaled = cv2.resize(gray, None, fx=MATCH_SCALE, fy=MATCH_SCALE, interpolation=cv2.INTER_AREA)
+        if gen is not None:
+            self._shot_cache = (gen, rgba, gray, scaled)
+        return rgba, gray, scaled
+
+    def get_screen_orientation(self, gen: int = None) -> int:
         """ 
         Get the screen orientation of the device.
+
+        Args:
+            gen (int, optional): If given, the screenshot for this polling tick is captured in the same
+                ADB round-trip and cached, so the following detect calls do not need their own. Defaults to None.
         
         Returns:
             int: The screen orientation of the device. 0 for portrait, 1 for landscape.
         """
-        orientation = self.device.shell("dumpsys window | grep mCurrentAppOrientation | awk '{ print $1 }'").split("=")[-1].strip()
+        cmd = "dumpsys window | grep mCurrentAppOrientation | awk '{ print $1 }'"
+        if gen is None:
+            output = self.device.shell(cmd)
+        else:
+            marker = "__SCREENCAP__" # separates the text output from the binary screenshot
+            data = self._exec(f"{cmd}; echo {marker}; screencap")
+            # the text output is short, only look for the marker in the start of the buffer
+            split = data[:1 << 16].tobytes().find(f"{marker}\n".encode())
+            if split == -1:
+                raise Exception(f"Unexpected output while taking a screenshot: {data[:200].tobytes()}")
+            # parse the screenshot from a view so the frame is not copied out of the buffer
+            self._store_screenshot(self._parse_screencap(data[split + len(marker) + 1:]), gen)
+            output = data[:split].tobytes().decode("utf-8")
+        orientation = output.split("=")[-1].strip()
         
         if orientation == "SCREEN_ORIENTATION_PORTRAIT":
             return 0
@@ -232,13 +465,24 @@ class GakuenUpdater():
         """
         return tuple(map(int, self.device.shell("wm size").split(" ")[-1].split("x")))
 
+    @functools.cached_property
+    def resolution(self) -> tuple:
+        """ 
+        The resolution of the device, queried once as it does not change during a session.
+        
+        Returns:
+            A tuple representing the resolution of the device in the format (width, height).
+        """
+        return self.get_resolution()
+
     def gakuen_installed(self) -> bool:
         """Check if com.bandainamcoent.idolmaster_gakuen is installed.
 
         Returns:
             bool: True if the package is installed, False otherwise.
         """
-        return "package:com.bandainamcoent.idolmaster_gakuen" in self.device.shell("pm list packages").split("\n")
+        # pm path only prints the package's own apk paths, instead of listing every installed package
+        return self.device.shell("pm path com.bandainamcoent.idolmaster_gakuen").strip().startswith("package:")
 
     def uninstall_gakuen(self) -> None:
         """Uninstall the com.bandainamcoent.idolmaster_gakuen package.
@@ -277,7 +521,7 @@ class GakuenUpdater():
         Returns:
             bool: True if the package is running, False otherwise.
         """
-        return "com.bandainamcoent.idolmaster_gakuen" in self.device.shell("ps -A").split("\n")
+        return bool(self.device.shell("pidof com.bandainamcoent.idolmaster_gakuen").strip())
 
     def launch_playstore(self):
         """Launches the Google Play Store with the specified package ID.
@@ -299,40 +543,170 @@ class GakuenUpdater():
         self.device.shell("am start -a android.intent.action.VIEW -d 'market://details?id=com.bandainamcoent.idolmaster_gakuen'")
         time.sleep(1)
 
-    def match_template(self, templates: dict, img: np.ndarray, 
-                       image_mode: str = "L", threshold: float = 0.8) -> pd.DataFrame:
+    def match_template(self, templates: list, img: np.ndarray = None, 
+                       threshold: float = 0.8, scaled: np.ndarray = None) -> list:
         """
         Match a list of templates to an image.
 
+        Only the best match of each template is kept, as each button appears at most once on screen.
+
         Parameters:
-            templates (dict): A dictionary containing the templates to match.
-            img (np.ndarray): The image to match the templates against.
-            image_mode (str, optional): The mode of the image. Defaults to "L".
+            templates (list): A list of (name, template) tuples to match, taken from ASSETS_NUMPY and named by their asset key.
+            img (np.ndarray, optional): The pre-decoded grayscale image to match the templates against. 
+                If None, a new screenshot is taken. Defaults to None.
             threshold (float, optional): The threshold for matching. Defaults to 0.8.
+            scaled (np.ndarray, optional): img downscaled by MATCH_SCALE, computed from img if None. Defaults to None.
 
         Returns:
-            pd.DataFrame: A DataFrame containing the matched templates and their scores.
+            list: A list of TemplateMatch for the templates scoring at least the threshold.
         """
-        screenshot = np.array(self.screenshot().convert(image_mode))
-        return matchTemplates(templates, screenshot, N_object=1, 
-                              score_threshold=threshold, method=cv2.TM_CCOEFF_NORMED)
+        return list(self.iter_template_matches(templates, img, threshold, scaled))
 
-    def click_template(self, templateResults: pd.DataFrame) -> pd.DataFrame:
+    def iter_template_matches(self, templates: list, img: np.ndarray = None, 
+                              threshold: float = 0.8, scaled: np.ndarray = None):
         """
-        Clicks on the templates in the given DataFrame if their score is above 0.8.
+        Lazily match a list of templates to an image, in the given order.
+
+        Each template is only matched once the previous match has been consumed,
+        so callers that only need the first hit can stop early.
+
+        Parameters:
+            templates (list): A list of (name, template) tuples to match, taken from ASSETS_NUMPY and named by their asset key.
+            img (np.ndarray, optional): The pre-decoded grayscale image to match the templates against. 
+                If None, a new screenshot is taken. Defaults to None.
+            threshold (float, optional): The threshold for matching. Defaults to 0.8.
+            scaled (np.ndarray, optional): img downscaled by MATCH_SCALE, computed from img if None. Defaults to None.
+
+        Yields:
+            TemplateMatch: The best match of each template scoring at least the threshold.
+        """
+        gray, scaled = self._match_images(img, scaled)
+        for name, template in templates:
+            match = self._match_one(gray, scaled, name, template, threshold)
+            if match is not None:
+                yield match
+
+    def _match_images(self, img: np.ndarray = None, scaled: np.ndarray = None) -> tuple:
+        """
+        Get the full resolution and downscaled grayscale images to match templates against.
+
+        Returns:
+            tuple: The grayscale image and the same image downscaled by MATCH_SCALE.
+        """
+        if not isinstance(img, np.ndarray):
+            _, img, scaled = self._get_screenshot()
+        elif scaled is None:
+            scaled = cv2.resize(img, None, fx=MATCH_SCALE, fy=MATCH_SCALE, interpolation=cv2.INTER_AREA)
+        return img, scaled
+
+    def _correlate(self, image: np.ndarray, name: str, template: np.ndarray, region: tuple) -> tuple:
+        """
+        Find the best match of a template within a region of an image.
+
+        Parameters:
+            image (np.ndarray): The grayscale image to search.
+            name (str): The asset key of the template.
+            template (np.ndarray): The template to match, at the same scale as the image.
+            region (tuple): (x0, y0, x1, y1) pixel region of the image to search, clamped to the image.
+
+        Returns:
+            tuple: The (score, x, y) of the best match in image coordinates, or None if the region is smaller than the template.
+        """
+        img_h, img_w = image.shape[:2]
+        h, w = template.shape[:2]
+        x0, y0 = max(int(region[0]), 0), max(int(region[1]), 0)
+        x1, y1 = min(int(region[2]), img_w), min(int(region[3]), img_h)
+        if x1 - x0 < w or y1 - y0 < h: # the region is smaller than the template, it cannot be on screen
+            return None
+
+        # the search regions only change with the orientation, so the correlation map is allocated once per shape
+        shape = (y1 - y0 - h + 1, x1 - x0 - w + 1)
+        buffer = self._match_buffers.get((name, shape))
+        if buffer is None:
+            buffer = self._match_buffers[(name, shape)] = np.empty(shape, dtype=np.float32)
+        # TM_SQDIFF_NORMED is not mean-subtracted, so the different orange buttons all score ~0.95 against each other;
+        # TM_CCOEFF_NORMED keeps them apart (~0.5-0.6) and is kept on purpose
+        result = cv2.matchTemplate(image[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED, buffer)
+        _, score, _, (x, y) = cv2.minMaxLoc(result)
+        return score, x0 + x, y0 + y
+
+    def _match_one(self, gray: np.ndarray, scaled: np.ndarray, name: str, template: np.ndarray, 
+                   threshold: float = 0.8, region: tuple = None) -> TemplateMatch:
+        """
+        Match a single template to an image.
+
+        The template is first located on the downscaled image, where scores drop by up to ~0.13 from pixel 
+        misalignment, with a threshold lowered by MATCH_COARSE_MARGIN. The candidate is then scored at full resolution 
+        in a small window around it, so the reported score and the threshold mean the same as without downscaling.
+
+        Parameters:
+            gray (np.ndarray): The full resolution grayscale image to match the template against.
+            scaled (np.ndarray): The same image downscaled by MATCH_SCALE.
+            name (str): The asset key of the template.
+            template (np.ndarray): The template to match, taken from ASSETS_NUMPY.
+            threshold (float, optional): The threshold for matching. Defaults to 0.8.
+            region (tuple, optional): (x0, y0, x1, y1) full resolution pixel region to search directly, 
+                skipping the downscaled search. Defaults to None.
+
+        Returns:
+            TemplateMatch: The best match, or None if it scores below the threshold.
+        """
+        h, w = template.shape[:2]
+        if region is None:
+            img_h, img_w = scaled.shape[:2]
+            coarse = self._correlate(scaled, name, self.ASSETS_SCALED[name], (0, 0, img_w, img_h))
+            if coarse is None or coarse[0] < threshold - MATCH_COARSE_MARGIN:
+                return None
+            # a downscaled pixel covers 1 / MATCH_SCALE full resolution pixels, search a little beyond that
+            pad = int(np.ceil(1 / MATCH_SCALE)) + 2
+            x, y = round(coarse[1] / MATCH_SCALE), round(coarse[2] / MATCH_SCALE)
+            region = (x - pad, y - pad, x + w + pad, y + h + pad)
+
+        match = self._correlate(gray, name, template, region)
+        if match is None or match[0] < threshold:
+            return None
+        score, x, y = match
+        return TemplateMatch(name, score, x, y, w, h)
+
+    def _match_near_last(self, gray: np.ndarray, name: str, template: np.ndarray, 
+                         threshold: float = 0.8, pad: int = 32) -> TemplateMatch:
+        """
+        Match a single template only in a small window around where it was last detected.
+
+        Parameters:
+            gray (np.ndarray): The full resolution grayscale image to match the template against.
+            name (str): The asset key of the template.
+            template (np.ndarray): The template to match, taken from ASSETS_NUMPY.
+            threshold (float, optional): The threshold for matching. Defaults to 0.8.
+            pad (int, optional): The margin around the last location to search, in pixels. Defaults to 32.
+
+        Returns:
+            TemplateMatch: The match, or None if the template was never detected or is not there anymore.
+        """
+        if name not in self._last_match:
+            return None
+        x, y = self._last_match[name]
+        h, w = template.shape[:2]
+        return self._match_one(gray, None, name, template, threshold, 
+                               region=(x - pad, y - pad, x + w + pad, y + h + pad))
+
+    def click_template(self, templateResults: list) -> list:
+        """
+        Clicks on the templates in the given list if their score is above 0.8.
+
+        All taps are sent in a single shell command, so clicking several templates costs one ADB round-trip.
 
         Args:
-            templateResults (pd.DataFrame): A DataFrame containing template matching results.
+            templateResults (list): A list of TemplateMatch results.
 
         Returns:
-            pd.DataFrame: The original DataFrame with the clicked templates.
-        """
-        for _, row in templateResults.iterrows():
-            # make sure the score is above 0.8
-            if row['Score'] < 0.8:
-                continue
-            x, y, w, h = row['BBox']
-            self.device.shell(f"input tap {x + w // 2} {y + h // 2}")
+            list: The original list with the clicked templates.
+        """
+        # make sure the score is above 0.8
+        taps = [f"input tap {match.x + match.w // 2} {match.y + match.h // 2}" 
+                for match in templateResults if match.score >= 0.8]
+        if taps:
+            self.device.shell("; ".join(taps))
         return templateResults
 
     def click_middle_screen(self) -> None:
@@ -345,53 +719,59 @@ class GakuenUpdater():
                 None
             """
             logging.info("Clicking screen.")
-            w, h = self.get_resolution()
+            w, h = self.resolution
             self.device.shell(f"input tap {w // 2} {h // 2}")
             time.sleep(1)
 
-    def detect_screen(self, screen_type: int, threshold: float = 0.8) -> bool:
+    def detect_screen(self, screen_type: int, threshold: float = 0.8, gen: int = None) -> bool:
         """
         Detects if the specified screen type is currently being displayed.
 
         Args:
             screen_type (int): The type of screen to detect. 0 for setup screen, 1 for loading screen.
             threshold (float, optional): The minimum score threshold for considering a screen as detected. Defaults to 0.8.
+            gen (int, optional): The polling tick whose screenshot should be reused. Defaults to None.
 
         Returns:
             bool: True if the specified screen is detected, False otherwise.
         """
+        _, gray, scaled = self._get_screenshot(gen)
         if screen_type == 0:
-            templateResp = self.match_template([("loading", self.ASSETS_NUMPY['gakuen_setup'])], self.screenshot())
+            templateResp = self.match_template([("gakuen_setup", self.ASSETS_NUMPY['gakuen_setup'])], gray, scaled=scaled)
         elif screen_type == 1:
-            templateResp = self.match_template([("loading", self.ASSETS_NUMPY['loading'])], self.screenshot())
+            templateResp = self.match_template([("loading", self.ASSETS_NUMPY['loading'])], gray, scaled=scaled)
         else:
             raise ValueError("Invalid screen type. Must be 0 for setup screen or 1 for loading screen.")
         
-        templateResp = templateResp[templateResp["Score"] > threshold] # filter out results with a score below the threshold
-        return not templateResp.empty
+        return any(match.score > threshold for match in templateResp) # ignore results with a score below the threshold
 
-    def detect_credit_screen(self, threshold: int = 200) -> bool:
+    def detect_credit_screen(self, threshold: int = 200, gen: int = None) -> bool:
         """ 
         Detects if the game is currently loading by analyzing the loading screen.
         
         Args:
             threshold (int): The threshold value to determine if the screen is mostly white.
+            gen (int, optional): The polling tick whose screenshot should be reused. Defaults to None.
         
         Returns:
             bool: True if the screen is mostly white (indicating loading), False otherwise.
         """
-        img = np.array(self.screenshot().convert("L")) # convert to grayscale, and then to numpy array
-        return np.mean(img) > threshold # if the mean is greater than 200, then the screen is mostly white
+        rgba = self.screenshot_raw() if gen is None else self._get_screenshot(gen)[0]
+        return mean_gray(rgba) > threshold # if the mean is greater than 200, then the screen is mostly white
     
-    def detect_move_forward(self, threshold: float = 0.8) -> bool:
+    def detect_move_forward(self, threshold: float = 0.8, gen: int = None) -> bool:
         """Detects if the move forward button is currently being displayed.
 
+        Args:
+            threshold (float, optional): The minimum score threshold for considering the button as detected. Defaults to 0.8.
+            gen (int, optional): The polling tick whose screenshot should be reused. Defaults to None.
+
         Returns:
             bool: True if the move forward button is detected, False otherwise.
         """
-        templateResp = self.match_template([("move_forward", self.ASSETS_NUMPY['gakuen_move_forward'])], self.screenshot())
-        templateResp = templateResp[templateResp["Score"] > threshold] 
-        return not templateResp.empty
+        _, gray, scaled = self._get_screenshot(gen)
+        templateResp = self.match_template([("gakuen_move_forward", self.ASSETS_NUMPY['gakuen_move_forward'])], gray, scaled=scaled)
+        return any(match.score > threshold for match in templateResp)
 
     def detect_setup_screen(self) -> bool:
         """Detects if the setup screen is currently being displayed.
@@ -401,71 +781,119 @@ class GakuenUpdater():
         """
         return self.detect_screen(0)
 
-    def detect_buttons(self, threshold: float = 0.8) -> pd.DataFrame:
+    def detect_buttons(self, threshold: float = 0.8, gen: int = None) -> list:
         """
-        Detects buttons in the screenshot and returns a DataFrame with the detected buttons and their scores.
+        Detects buttons in the screenshot and returns a list with the detected buttons and their scores.
+
+        Only the first button found is returned; the templates are scanned in order of how often they are hit,
+        and the remaining ones are skipped. Callers click it and detect again on a new screenshot.
 
         Args:
             threshold (float, optional): The minimum score threshold for considering a button as detected. Defaults to 0.8.
+            gen (int, optional): The polling tick whose screenshot should be reused. Defaults to None.
 
         Returns:
-            pd.DataFrame: A DataFrame containing the detected buttons and their scores.
-        """
-        # detect consent, agree, and agree_all buttons
-        templateResp = self.match_template([("consent", self.ASSETS_NUMPY['gakuen_consent']),
-                                            ("agree", self.ASSETS_NUMPY['gakuen_agree']),
-                                            ("agree_all", self.ASSETS_NUMPY['gakuen_agree_all']),
-                                            ("move_forward", self.ASSETS_NUMPY['gakuen_move_forward'])], 
-                                            self.screenshot().convert("L"))
-        templateResp = templateResp[templateResp["Score"] > threshold]
-        return templateResp
-
-    def click_buttons(self, clickUntilNone: bool = False) -> None:
+            list: A list containing the TemplateMatch of the first detected button, or an empty list.
+        """
+        # detect agree_all, agree, consent, and move_forward buttons
+        _, gray, scaled = self._get_screenshot(gen)
+        templates = [("gakuen_agree_all", self.ASSETS_NUMPY['gakuen_agree_all']),
+                     ("gakuen_agree", self.ASSETS_NUMPY['gakuen_agree']),
+                     ("gakuen_consent", self.ASSETS_NUMPY['gakuen_consent']),
+                     ("gakuen_move_forward", self.ASSETS_NUMPY['gakuen_move_forward'])]
+        # check around the last known button locations first, a button that is still there is found with a tiny search
+        match = next((match for match in (self._match_near_last(gray, name, template, threshold) 
+                                          for name, template in templates)
+                      if match is not None and match.score > threshold), None)
+        if match is None:
+            templateResp = self.iter_template_matches(templates, gray, threshold, scaled)
+            match = next((match for match in templateResp if match.score > threshold), None)
+        if match is None:
+            return []
+
+        self._last_match[match.name] = (match.x, match.y)
+        return [match]
+
+    def click_buttons(self, clickUntilNone: bool = False, gen: int = None) -> None:
         """
         Clicks any of the buttons that are detected.
 
         Args:
             clickUntilNone (bool, optional): Specifies whether to keep clicking buttons until none are detected. 
                 Defaults to False.
+            gen (int, optional): The polling tick whose screenshot should be reused for the first detection. 
+                Screenshots after a click are always taken fresh. Defaults to None.
 
         Returns:
             None
         """
         # click any of the buttons that are detected
-        templateResponse = self.detect_buttons()
+        templateResponse = self.detect_buttons(gen=gen)
 
         if clickUntilNone:
-            while not templateResponse.empty:
+            while templateResponse:
                 self.click_template(templateResponse)
                 templateResponse = self.detect_buttons()
         else:
-            if not templateResponse.empty:
+            if templateResponse:
                 self.click_template(templateResponse)
 
-    def wait_install(self, timeout:int = 300, delay:int = 1) -> bool:
+    def wait_install(self, timeout:int = 300, delay:float = 1) -> bool:
         """ 
         Wait for the game to finish installing.
 
+        The device log is followed for lines mentioning the package, and the installation is checked again as soon
+        as one announces that the install finished, instead of only once per delay. Other lines about the package
+        are ignored, so a busy log cannot make the checks run back to back.
+
         Args:
             timeout (int): The maximum time to wait for the game to finish installing, in seconds. Default is 300 seconds.
-            delay (int): The delay between each check for game installation, in seconds. Default is 1 second.
+            delay (float): The maximum delay between each check for game installation, in seconds. Default is 1 second.
 
         Returns:
             bool: True if the game finishes installing within the specified timeout, False otherwise.
         """
         logging.info("Waiting for game to finish installing.")
-        return self.wait_function(self.gakuen_installed, timeout=timeout, delay=delay, boolean=False)
+        markers = (b"PACKAGE_ADDED", b"PACKAGE_REPLACED", b"Installed package") # log lines of a finished install
+        log = b""
+        start = time.time()
+        conn = self.device.create_connection()
+        with conn:
+            conn.send("exec:logcat -T 1 | grep --line-buffered com.bandainamcoent.idolmaster_gakuen")
+            while not self.gakuen_installed():
+                if time.time() - start > timeout:
+                    return False
+                # wait for the install to be announced, but check at least once per delay in case it never is
+                next_check = time.time() + delay
+                while (remaining := next_check - time.time()) > 0:
+                    conn.socket.settimeout(remaining)
+                    try:
+                        chunk = conn.socket.recv(4096)
+                    except socket.timeout:
+                        break
+                    if not chunk: # logcat exited, fall back to polling
+                        time.sleep(remaining)
+                        break
+                    log = (log + chunk)[-4096:] # keep the tail, a marker may be split between two chunks
+                    if any(marker in log for marker in markers):
+                        log = b""
+                        break
+        return True
 
     def wait_function(self, func: callable, exec_func: callable = None, 
-                      timeout: int = 30, delay: int = 1, boolean:bool = True) -> bool:
+                      timeout: int = 30, delay: float = 0.1, max_delay: float = 1, boolean:bool = True) -> bool:
         """ 
         Wait for the game to finish loading.
 
+        The delay between checks starts small and doubles after every check until it reaches max_delay,
+        so quick transitions are noticed quickly without polling faster than needed during long waits.
+
         Args:
             func (callable): A callable function that returns True if the game is still loading, and False otherwise.
             exec_func (callable): A callable function to execute while waiting for the game to finish loading. Default is None.
             timeout (int): The maximum time to wait for the game to finish loading, in seconds. Default is 30 seconds.
-            delay (int): The delay between each check for game loading, in seconds. Default is 1 second.
+            delay (float): The initial delay between each check for game loading, in seconds. Default is 0.1 seconds.
+            max_delay (float): The maximum delay between each check for game loading, in seconds. Default is 1 second.
 
         Returns:
             bool: True if the game finishes loading within the specified timeout, False otherwise.
@@ -478,15 +906,15 @@ class GakuenUpdater():
             if exec_func is not None:
                 exec_func()
             time.sleep(delay)
+            delay = min(delay * 2, max_delay)
         return True
     
-    def playstore_detect_install(self,) -> pd.DataFrame:
+    def playstore_detect_install(self,) -> list:
         """Detects if the install button is visible in the play store.
         Returns:
-            pd.DataFrame: A DataFrame containing the match results.
+            list: A list of TemplateMatch containing the match results.
         """
-        return self.match_template([("button",  self.ASSETS_NUMPY["playstore_install"])], 
-                                       self.screenshot())
+        return self.match_template([("playstore_install",  self.ASSETS_NUMPY["playstore_install"])])
 
     def playstore_install(self) -> None:
         """Clicks the install button in the playstore.
@@ -498,7 +926,7 @@ class GakuenUpdater():
             None
         """
         templateResults = self.playstore_detect_install()
-        assert not templateResults.empty, "Could not find the install button."
+        assert templateResults, "Could not find the install button."
         self.click_template(templateResults)
         
 if __name__ == "__main__":